@@ -4,7 +4,7 @@ The examples in this file use the DataWriter class to write data to different fi
 
 import numpy as np
 import tables as tb
-from silab_collections.meas.data_writer import DataWriter
+from silab_collections.meas.data_writer import DataWriter, H5Session
 from time import asctime, time
 
 
@@ -61,7 +61,32 @@ def write_h5_example():
                     print(ll)
 
 
+def write_h5_session_example():
+
+    print("### DataWriter Example with multiple tables in one HDF5 output file ###\n")
+
+    # Keep a single file open for multiple measurements
+    with H5Session(outfile=OUTFILE + '_session', overwrite=True) as session:
+
+        for i in range(3):
+
+            # Each measurement is written to its own group
+            with session.writer(group_name=f'sweep_{i}',
+                                columns=COLMUNS,
+                                identifier=IDENTIFIER,
+                                comments=COMMENTS) as writer:
+
+                writer.write_row(time(), 10.0, 1e-6)
+                writer.write_row(timestamp=time(), voltage=20.0, current=2e-6)
+
+    print(f"File content of {OUTFILE}_session.h5", '\n')
+    with tb.open_file(f'{OUTFILE}_session.h5', 'r') as f:
+        print(f)
+
+
 if __name__ == '__main__':
     write_csv_example()
     print('\n' * 3)
-    write_h5_example()
\ No newline at end of file
+    write_h5_example()
+    print('\n' * 3)
+    write_h5_session_example()
\ No newline at end of file
@@ -12,10 +12,10 @@ MU = 50
 SIGMA = 1.5
 N_SAMPLES = 100_000
 NORMAL_SAMPLES = np.random.normal(loc=MU, scale=SIGMA, size=N_SAMPLES)  # Draw from normal distribution with given mu and sigma
+CHANNEL_SAMPLES = np.round(NORMAL_SAMPLES).astype(int)  # Detector response is recorded in discrete channels
 
-# Make data for fitting
-DATA, _edges = np.histogram(NORMAL_SAMPLES, bins=100)
-CHANNELS = (_edges[1:] + _edges[:-1]) / 2.0
+# Make data for fitting; integer channel data is histogrammed with np.bincount instead of np.histogram
+DATA, CHANNELS = fit.hist_integer(CHANNEL_SAMPLES)
 
 
 def gauss(x, mu, sigma, amplitude):
@@ -23,6 +23,12 @@ def gauss(x, mu, sigma, amplitude):
     return amplitude * np.exp(-0.5 * (x - mu)**2 / sigma**2)
 
 
+def gauss_jac(x, mu, sigma, amplitude):
+    # Define analytic Jacobian of the Gaussian w.r.t. its parameters (mu, sigma, amplitude)
+    e = np.exp(-0.5 * (x - mu)**2 / sigma**2)
+    return np.stack([amplitude * e * (x - mu) / sigma**2, amplitude * e * (x - mu)**2 / sigma**3, e], axis=1)
+
+
 def fit_basic_example():
     """
     Example of fit.fit_basic function
@@ -31,11 +37,8 @@ def fit_basic_example():
     a typical use-case for fit_basic because channels are discrete (a.k.a no errors are assumed)
     """
     
-    # Calculate uncertainty on the data
-    y_err = np.sqrt(DATA)
-
-    # Set uncertainty to infinity where the uncertainty is 0 in order to not restrict the fit
-    y_err[y_err == 0] = np.inf
+    # Calculate uncertainty on the data; set it to infinity where it is 0 in order to not restrict the fit
+    y_err = np.where(DATA > 0, np.sqrt(DATA), np.inf)
 
     # Estimator for starting parameters for the fit routine
     p0 = [MU, SIGMA, DATA.max()]
@@ -45,6 +48,7 @@ def fit_basic_example():
                                           x=CHANNELS,
                                           y=DATA,
                                           y_err=y_err,
+                                          jac=gauss_jac,  # Analytic Jacobian saves numerical derivative evaluations
                                           p0=p0)
 
     # Make result string
@@ -65,11 +69,8 @@ def fit_odr_example():
     a typical use-case for fit_basic because channels are discrete (a.k.a no errors are assumed)
     """
     
-    # Calculate uncertainty on the data
-    y_err = np.sqrt(DATA)
-
-    # Set uncertainty to infinity where the uncertainty is 0 in order to not restrict the fit
-    y_err[y_err == 0] = np.inf
+    # Calculate uncertainty on the data; set it to infinity where it is 0 in order to not restrict the fit
+    y_err = np.where(DATA > 0, np.sqrt(DATA), np.inf)
 
     # Assume the channels now can be converted to energy by a calibration energy(channel) = a * channel
     # a is the calibration constant in keV / channel
@@ -55,6 +55,14 @@ def iv_scan_example():
     #                  overwrite=True,  # Additional kwargs are passed to the writer
     #                  outtype=DataWriter.TABLES)  # Additional kwargs are passed to the writer
 
+    # # Do iv scan
+    # iv.iv_scan(outfile='iv_scan_basic_example_4.csv',
+    #            iv_setup=iv_setup,
+    #            bias_voltage=60,  # IV scan from 0 to 60 V in 1 V steps
+    #            current_limit=1e-6,  # Current limit in A
+    #            smu_sweep=True,  # Let the Keithley 2410 sweep through the voltages itself and read back all currents at once
+    #            overwrite=True)  # Additional kwargs are passed to the writer
+
 
 if __name__ == '__main__':
     iv_scan_example()
\ No newline at end of file
@@ -31,7 +31,49 @@ def red_chisquare(meas, model, meas_err, model_popt):
     return np.sum(np.square((meas - model) / meas_err)) / (len(meas_err) - len(model_popt) - 1.0)
 
 
-def fit_basic(fit_func, x, y, p0, y_err=None, return_pcov=False, **fit_kwargs):
+def hist_integer(samples, n_channels=None):
+    """
+    Histogram integer samples such as e.g. counts of a multi-channel analyzer (MCA) or a pixel detector TOT
+    into bins of width 1 using np.bincount, which is considerably faster than np.histogram for this case
+
+    Parameters
+    ----------
+    samples: list, np.array
+        Integer samples, each sample being a channel number
+    n_channels: int, None
+        If given, the counts of the channels 0 to *n_channels* - 1 are returned and all samples must lie within.
+        If None, the counts of the channels from the minimum to the maximum of *samples* are returned
+
+    Raises
+    ------
+    ValueError
+        *n_channels* is given and *samples* lie outside of the channels 0 to *n_channels* - 1
+
+    Returns
+    -------
+    tuple: counts, channels
+    """
+
+    samples = np.asarray(samples)
+
+    # Empty samples, e.g. from an empty list, default to float
+    if not samples.size:
+        samples = samples.astype(int)
+
+    if n_channels is None:
+        first_channel = samples.min() if samples.size else 0
+        counts = np.bincount(samples - first_channel)
+        channels = np.arange(first_channel, first_channel + len(counts))
+    else:
+        if samples.size and (samples.min() < 0 or samples.max() >= n_channels):
+            raise ValueError(f"*samples* must lie within channels 0 to {n_channels - 1}")
+        counts = np.bincount(samples, minlength=n_channels)
+        channels = np.arange(n_channels)
+
+    return counts, channels
+
+
+def fit_basic(fit_func, x, y, p0, y_err=None, return_pcov=False, jac=None, **fit_kwargs):
     """
     Simple function that takes data as well as error and optimizes *fit_func* to
     it using non-linear least-squares fit provided by scipy.optimize.curve_fit.
@@ -49,6 +91,9 @@ def fit_basic(fit_func, x, y, p0, y_err=None, return_pcov=False, **fit_kwargs):
         Estimator of starting parameters for fitting routine
     return_pcov: bool
         Whether to append the covariance matrix of the fit parameters to the returned tuple
+    jac: callable, None
+        Analytic Jacobian of *fit_func* in the form of jac(x, a, b, c, ...) -> np.array of shape (len(x), len(p0)).
+        If None, the Jacobian is estimated numerically which requires additional evaluations of *fit_func*
 
     Returns
     -------
@@ -59,7 +104,7 @@ def fit_basic(fit_func, x, y, p0, y_err=None, return_pcov=False, **fit_kwargs):
         warnings.warn("The *curve_fit* routine relies on proper starting parameters *p0* to ensure convergance.", Warning)
 
     # We are using curve_fit; absolute_sigma=True indicates sigma has unit
-    popt, pcov = curve_fit(f=fit_func, xdata=x, ydata=y, sigma=y_err, absolute_sigma=True, p0=p0, **fit_kwargs)
+    popt, pcov = curve_fit(f=fit_func, xdata=x, ydata=y, sigma=y_err, absolute_sigma=True, p0=p0, jac=jac, **fit_kwargs)
 
     # Calculate fit errors
     perr = np.sqrt(np.diag(pcov))
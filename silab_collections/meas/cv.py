@@ -10,6 +10,9 @@ from silab_collections.meas.data_writer import DataWriter
 from basil.dut import Dut
 from tqdm import tqdm
 from time import time, sleep, strftime
+from operator import attrgetter
+from math import sqrt
+from concurrent.futures import ThreadPoolExecutor
 
 
 def cv_scan(outfile, cv_setup, smu_name, lcr_name, ac_voltage, ac_frequency, bias_voltage, current_limit, lcr_func='CPRP', bias_polarity=1, bias_settle_delay=5, bias_steps=None, n_meas=1, log_progress=False, **writer_kwargs):
@@ -80,7 +83,7 @@ def cv_scan(outfile, cv_setup, smu_name, lcr_name, ac_voltage, ac_frequency, bia
                                      f'AC voltage: {ac_voltage} V @ {ac_frequency} Hz',
                                      f'Current limit: {current_limit:.2E} A',
                                      f'Measurements per voltage step: {n_meas}',
-                                     f"Bias voltages: ({', '.join(str(bv) for bv in bias_volts)}) V"]
+                                     f"Bias voltages: {np.array2string(bias_volts, separator=', ', threshold=20, max_line_width=np.inf)} V"]
     
     # Don't allow the user to set the columns
     if n_meas == 1:
@@ -91,6 +94,9 @@ def cv_scan(outfile, cv_setup, smu_name, lcr_name, ac_voltage, ac_frequency, bia
     if 'outtype' in writer_kwargs and writer_kwargs['outtype'] == DataWriter.TABLES:
         writer_kwargs['columns'] = np.dtype(list(zip(writer_kwargs['columns'], [float] * len(writer_kwargs['columns']))))
 
+    # We write one row per bias voltage
+    writer_kwargs.setdefault('expected_rows', len(bias_volts))
+
     # Make instance of data writer
     data_writer = DataWriter(outfile=outfile, **writer_kwargs)
 
@@ -105,64 +111,92 @@ def cv_scan(outfile, cv_setup, smu_name, lcr_name, ac_voltage, ac_frequency, bia
     lcr.frequency = ac_frequency
     lcr.set_meas_func(lcr_func)
     lcr.set_trigger_mode('HOLD')
+
+    # Resolve the LCR measurement function once instead of per measurement
+    lcr_read = attrgetter(lcr_func)
+
+    # If SMU and LCR meter use different interfaces, read them concurrently to overlap their round-trip latencies
+    lcr_pool = ThreadPoolExecutor(max_workers=1) if smu._intf is not lcr._intf else None
     
     try:
 
         with data_writer as writer:
 
+            # Bind callables and delays used for every measurement once
+            set_voltage, read_current = smu_utils.set_voltage, smu_utils.get_current_reading
+            meas_delay = meas.MEAS_DELAY
+
+            def measure():
+                # Returns a tuple of (current, primary, secondary)
+                if lcr_pool is None:
+                    return (read_current(smu=smu), *lcr_read(lcr))
+                lcr_future = lcr_pool.submit(lcr_read, lcr)
+                return (read_current(smu=smu), *lcr_future.result())
+
+            # Hoist constants of the current limit check
+            abs_limit, overflow = abs(current_limit), smu_utils.OVERFLOW_READING
+
             # Make progress bar to loop over voltage steps
-            pbar_volts = tqdm(bias_volts, unit='bias voltage', desc='CV scan')
+            pbar_volts = tqdm(bias_volts, unit='bias voltage', desc='CV scan', mininterval=0.5)
 
             # Start looping over voltages
             for bias in pbar_volts:
                 
                 # Set next voltage
-                smu.set_voltage(bias)
+                set_voltage(smu=smu, voltage=bias)
+                bias_set_time = time()
 
                 # Short sleep to prevent wrong read of compliance limit off of SMU
                 sleep(0.1)
     
                 # Read current 
-                current = smu_utils.get_current_reading(smu=smu)
+                current = read_current(smu=smu)
 
-                # Check if we are above the current limit
-                if abs(current) > abs(current_limit) and current < 1e37:
+                # Check if we are above the current limit; overflow readings do not count as exceeding it
+                if current < -abs_limit or abs_limit < current < overflow:
                     warnings.warn(f"Current limit exceeded with {current:.2E} A. Abort.", Warning)
                     break
+                elif current >= overflow:
+                    warnings.warn(f"Current reading overflow ({current:.2E}) @ {bias} V.", Warning)
                 
-                # Let the voltage settle
-                sleep(meas.BIAS_SETTLE_DELAY)
+                # Let the voltage settle; the settle delay already started when the voltage was set
+                sleep(max(0, bias_settle_delay - (time() - bias_set_time)))
             
                 # We only take one measurement
                 if n_meas == 1:
-                    current = smu_utils.get_current_reading(smu=smu)
-                    primary, secondary = getattr(lcr, lcr_func)
-                    writer.write_row(timestamp=time(), bias=bias, current=current, primary=primary, secondary=secondary)
-                    meas_str = f'LCR function: {lcr_func}, Primary: {primary:.3E}, Secondary: {secondary:.3E}'
+                    current, primary, secondary = measure()
+                    writer.write_row(time(), bias, current, primary, secondary)
                     current_str = f'Current={current:.3E}A'
+                    if log_progress:
+                        meas_str = f'LCR function: {lcr_func}, Primary: {primary:.3E}, Secondary: {secondary:.3E}'
                 
                 # Take n_meas > 1 measurements
                 else:
-                    current, primary, secondary = (np.zeros(shape=n_meas, dtype=float) for _ in range(3))
-                    for i in range(n_meas):
-                        current[i] = smu_utils.get_current_reading(smu=smu)
-                        primary[i], secondary[i] = getattr(lcr, lcr_func)
-                        sleep(meas.MEAS_DELAY)
-
-                    writer.write_row(timestamp=time(), bias=bias, mean_current=current.mean(), std_current=current.std(),
-                                     mean_primary=primary.mean(), std_primary=primary.std(), mean_secondary=secondary.mean(),
-                                     std_secondary=secondary.std())
-                    meas_str = "LCR function: {}, Primary: ({:.3E}{}{:.3E}), Secondary: ({:.3E}{}{:.3E})".format(lcr_func,
-                                                                                                                 primary.mean(),
-                                                                                                                 u'\u00B1',
-                                                                                                                 primary.std(),
-                                                                                                                 secondary.mean(),
-                                                                                                                 u'\u00B1', 
-                                                                                                                 secondary.std())
-                    current_str = 'Current=({:.3E}{}{:.3E})A'.format(current.mean(), u'\u00B1', current.std())
+                    # Single-pass mean and sum of squared deviations of current, primary and secondary (Welford's algorithm)
+                    means, sq_devs = [0.0] * 3, [0.0] * 3
+                    for i in range(1, n_meas + 1):
+                        for j, x in enumerate(measure()):
+                            delta = x - means[j]
+                            means[j] += delta / i
+                            sq_devs[j] += delta * (x - means[j])
+                        sleep(meas_delay)
+
+                    mean_current, mean_primary, mean_secondary = means
+                    std_current, std_primary, std_secondary = (sqrt(sq_dev / n_meas) for sq_dev in sq_devs)
+
+                    writer.write_row(time(), bias, mean_current, std_current, mean_primary, std_primary, mean_secondary, std_secondary)
+                    current_str = 'Current=({:.3E}{}{:.3E})A'.format(mean_current, u'\u00B1', std_current)
+                    if log_progress:
+                        meas_str = "LCR function: {}, Primary: ({:.3E}{}{:.3E}), Secondary: ({:.3E}{}{:.3E})".format(lcr_func,
+                                                                                                                     mean_primary,
+                                                                                                                     u'\u00B1',
+                                                                                                                     std_primary,
+                                                                                                                     mean_secondary,
+                                                                                                                     u'\u00B1',
+                                                                                                                     std_secondary)
                 
-                # Update progressbars poststr
-                pbar_volts.set_postfix_str(current_str)
+                # Update progressbars poststr; it is rendered with the next progressbar update, at most every *mininterval* seconds
+                pbar_volts.set_postfix_str(current_str, refresh=False)
 
                 if log_progress:
                     # Construct string
@@ -171,6 +205,9 @@ def cv_scan(outfile, cv_setup, smu_name, lcr_name, ac_voltage, ac_frequency, bia
 
     finally:
 
+        if lcr_pool is not None:
+            lcr_pool.shutdown()
+
         # Discard anything on the transfer layer input buffer from potential remnants due to Exception
         sleep(1)
         smu._intf._port.reset_input_buffer()
@@ -184,7 +221,8 @@ def cv_scan(outfile, cv_setup, smu_name, lcr_name, ac_voltage, ac_frequency, bia
         except RuntimeError:
             pass
         
-        smu_utils.call_method_if_exists(smu, 'off')
+        if smu_utils.describe_smu(smu).has_off:
+            smu.off()
 
         if _close_dut:
             dut.close()
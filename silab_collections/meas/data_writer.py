@@ -3,8 +3,10 @@ Implemenntation of a context manager *DataWriter* enabling writing data row by r
 *DataWriter* enables writing to a comma separated value (CSV) file or as well as HDF5 binary file.
 """
 
+import io
 import os
 import csv
+from operator import itemgetter
 import numpy as np
 import tables as tb
 
@@ -20,7 +22,12 @@ class DataWriter:
     TABLES: int = 1
     _FILE_EXTENSION: dict = {CSV: '.csv', TABLES: '.h5'}
 
-    def __init__(self, outfile, columns, identifier='measurement', outtype=CSV, comments='', overwrite=False):
+    # Compression and target chunk size in bytes of HDF5 tables; use Blosc2 with the fast LZ4 codec if supported by PyTables
+    _TABLES_COMPLIB: str = 'blosc2:lz4' if 'blosc2:lz4' in tb.filters.all_complibs else 'blosc:lz4'
+    _TABLES_FILTERS: tb.Filters = tb.Filters(complevel=5, complib=_TABLES_COMPLIB, shuffle=True)
+    _TABLES_CHUNK_BYTES: int = 2**20
+
+    def __init__(self, outfile, columns, identifier='measurement', outtype=CSV, comments='', overwrite=False, batch_size=100, flush_every=None, expected_rows=None, csv_quoting=csv.QUOTE_NONNUMERIC, filters=None, chunkshape=None):
         """
         Parameters
         ----------
@@ -37,6 +44,27 @@ class DataWriter:
             of the data recording such as temperature, humidity, date, measurement device, etc. 
         overwrite : bool, optional
             Whether to overwrite outfile if it already exists, by default False
+        batch_size : int, optional
+            Number of rows which are buffered in memory before being written to *outfile* at once, by default 100.
+            Remaining rows are written when leaving the context
+        flush_every : int, optional
+            If given, all pending rows are written and the file is flushed every *flush_every* rows, by default None.
+            Otherwise, the file is flushed only when leaving the context
+        expected_rows : int, optional
+            Expected number of rows to be written, by default None. Only used for outtype=TABLES in order to size
+            the chunks of the HDF5 table, which are at most 1 MiB large
+        csv_quoting : int, optional
+            Quoting of values for outtype=CSV using the csv module constants with '#' as quote character,
+            by default csv.QUOTE_NONNUMERIC. If all values are numeric, csv.QUOTE_MINIMAL or csv.QUOTE_NONE
+            skip the type check of each value
+        filters : tables.Filters, str, optional
+            Compression filters of the HDF5 table for outtype=TABLES, by default None which uses level 5
+            Blosc2 (or Blosc if not supported) with the LZ4 codec and shuffling. If str, the name of the
+            compression library in tables.filters.all_complibs, e.g. 'blosc2:zstd', used with level 5 and shuffling.
+            Shuffling is most effective for chunks of many rows, see *chunkshape*
+        chunkshape : int, tuple of int, optional
+            Number of rows per chunk of the HDF5 table for outtype=TABLES, by default None which uses
+            chunks of at most 1 MiB, see *expected_rows*
         """
 
         # Store instances init attributes
@@ -46,19 +74,73 @@ class DataWriter:
         self.columns = columns
         self.identifier = identifier
         self.overwrite = overwrite
+        self.batch_size = batch_size
+        self.flush_every = flush_every
+        self.expected_rows = expected_rows
+        self.csv_quoting = csv_quoting
+        self.filters = filters
+        self.chunkshape = chunkshape
         
         # Attribute for storing file handle
         self.file = None
 
+        # Open HDF5 file and group to create the table in, see *open_group*
+        self._h5file = None
+        self._group_name = None
+
         # Privates 
         self._writer = {}
         self._col_names = None
+        self._col_getter = None
+        self._is_tables = None
+        self._header = None
+        self._buffer = None
+        self._csv_batch = None
+        self._n_buffered = 0
+        self._n_rows = 0
+        # Writes a single row; bound to the method of the respective *self.out_type* when opening
+        self._write_row = None
 
         # Private methods for setting up the instance
         self._check_extension()
         self._check_sanity()
         self._check_columns()
         self._prepare_comments()
+        self._prepare_header()
+
+    @classmethod
+    def open_group(cls, h5file, group_name, columns, identifier='measurement', comments='', **kwargs):
+        """
+        Create a *DataWriter* which writes to a new table in an already open HDF5 file instead of a file of its own.
+        Useful for writing many measurements into a single file, see *H5Session*
+
+        Parameters
+        ----------
+        h5file : tables.File
+            Open HDF5 file to write to; it is not closed when leaving the context of the returned *DataWriter*
+        group_name : str, None
+            Name of the group the table is created in, created if not existing; if None, the root group is used
+        columns : np.dtype
+            Description of columns the data is written to
+        identifier : str, optional
+            Name of the table within *group_name*, by default 'measurement'
+        comments : str, iterable of str, optional
+            Comments which are stored as title of the table, by default ''
+        kwargs : optional
+            Keyword arguments *batch_size*, *flush_every* and *expected_rows* of *DataWriter*
+
+        Returns
+        -------
+        DataWriter
+            Instance writing to *h5file*
+        """
+
+        # The file already exists since it is open, but it is added to rather than overwritten
+        writer = cls(outfile=h5file.filename, columns=columns, identifier=identifier, outtype=cls.TABLES, comments=comments, overwrite=True, **kwargs)
+        writer._h5file = h5file
+        writer._group_name = group_name
+
+        return writer
 
     def _check_sanity(self):
         """
@@ -69,7 +151,8 @@ class DataWriter:
         IOError
             If *self.outfile* already exists and this instance is not allowed to overwrite
         ValueError
-            When *self.identifier* is not a non-empty string
+            When *self.identifier* is not a non-empty string or *self.batch_size* / *self.flush_every* is not a positive integer
+            or *self.filters* is not a supported compression library
         """
 
         if os.path.isfile(self.out_file) and not self.overwrite:
@@ -80,6 +163,15 @@ class DataWriter:
         if not self.identifier or not isinstance(self.identifier, str):
             raise ValueError(f"*identifier* must be non-empty string, is '{self.identifier}'")
 
+        if not isinstance(self.batch_size, int) or self.batch_size < 1:
+            raise ValueError(f"*batch_size* must be positive integer, is '{self.batch_size}'")
+
+        if self.flush_every is not None and (not isinstance(self.flush_every, int) or self.flush_every < 1):
+            raise ValueError(f"*flush_every* must be None or positive integer, is '{self.flush_every}'")
+
+        if isinstance(self.filters, str) and self.filters not in tb.filters.all_complibs:
+            raise ValueError(f"*filters* must be one of {', '.join(tb.filters.all_complibs)}, is '{self.filters}'")
+
     def _check_columns(self):
         """
         Check the data columns of the output file
@@ -102,6 +194,15 @@ class DataWriter:
         else:
             raise NotImplementedError(f"Output file type {self.out_type} not supported.")
 
+        # The output type is valid from here on, so it only needs to be distinguished between TABLES and CSV
+        self._is_tables = self.out_type == self.TABLES
+
+        # Get the values of a dict in column order at once; itemgetter returns a single value instead of a tuple for one column
+        if len(self._col_names) > 1:
+            self._col_getter = itemgetter(*self._col_names)
+        else:
+            self._col_getter = lambda row, col=self._col_names[0]: (row[col],)
+
     def _check_extension(self):
         """
         Check the file extension for the respective *self.out_type* and add it, if not given
@@ -124,47 +225,153 @@ class DataWriter:
             # If the *self.comments* is a single string we dont have to do anything
             if isinstance(self.comments, str):
                 self.comments = [self.comments]
-            elif isinstance(self.comments, (list, tuple)):
+            else:
+                # Materialize any iterable, e.g. a generator, once such that it is validated and joined from a list
+                try:
+                    self.comments = list(self.comments)
+                except TypeError:
+                    raise ValueError("*comments* must be string or iterable of strings.")
 
                 if not all(isinstance(c,  str) for c in self.comments):
                     raise ValueError("*comments* must be string or iterable of strings.")
-            else:
-                raise ValueError("*comments* must be string or iterable of strings.")
+
+    def _prepare_header(self):
+        """
+        Prepare the header of *self.out_file* once: the table title for outtype=TABLES or
+        the encoded comment lines containing identifier, comments and columns for outtype=CSV
+        """
+
+        if self._is_tables:
+            self._header = 'Comments: ' + '; '.join(self.comments)
+        else:
+            header = '# Identifier:\n#\t{}\n'.format(self.identifier)
+            header += '# Comments:\n#\t{}\n'.format('\n#\t'.join(self.comments))
+            header += '# Columns:\n#\t{}\n'.format(', '.join(self._col_names))
+            self._header = header.encode()
 
     def _open(self):
         """
         Opens the respective *self.out_file* of type *self.out_type*.
         Called from within the __enter__ method
-
-        Raises
-        ------
-        NotImplementedError
-            The *self.out_type* is not implemented
         """
 
-        if self.out_type == self.TABLES:
-            self.file = tb.open_file(self.out_file, mode='w')
-            self._writer[self.out_type] = self.file.create_table(where=self.file.root,
+        if self._is_tables:
+            # Chunks of 1 MiB, or smaller if fewer rows are expected
+            if self.chunkshape is None:
+                chunk_rows = max(1, self._TABLES_CHUNK_BYTES // self.columns.itemsize)
+                if self.expected_rows:
+                    chunk_rows = min(chunk_rows, self.expected_rows)
+                chunkshape = (chunk_rows,)
+            else:
+                chunkshape = self.chunkshape
+
+            # Compression by name of the library uses the same level and shuffling as the default
+            if self.filters is None:
+                filters = self._TABLES_FILTERS
+            elif isinstance(self.filters, str):
+                filters = tb.Filters(complevel=5, complib=self.filters, shuffle=True)
+            else:
+                filters = self.filters
+
+            # Create the table in the given group of an already open file or in a new file
+            if self._h5file is not None:
+                self.file = self._h5file
+                where = f'/{self._group_name}' if self._group_name else '/'
+            else:
+                # Atomically ensure the file did not come into existence since initialization; PyTables has no exclusive mode
+                if not self.overwrite:
+                    os.close(os.open(self.out_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL))
+                self.file = tb.open_file(self.out_file, mode='w')
+                where = '/'
+
+            self._writer[self.out_type] = self.file.create_table(where=where,
                                                                  name=self.identifier,
                                                                  description=self.columns,
-                                                                 title='Comments: ' + '; '.join(self.comments))
-        elif self.out_type == self.CSV:
-            self.file = open(self.out_file, mode='w')
-            self._writer[self.out_type] = csv.writer(self.file, quoting=csv.QUOTE_NONNUMERIC, quotechar='#')
-            
-            self.file.write('# Identifier:\n#\t{}\n'.format(self.identifier))
-            self.file.write('# Comments:\n#\t{}\n'.format('\n#\t'.join(self.comments)))
-            self.file.write('# Columns:\n#\t{}\n'.format(', '.join(self._col_names)))
-            
+                                                                 title=self._header,
+                                                                 filters=filters,
+                                                                 expectedrows=self.expected_rows or tb.parameters.EXPECTED_ROWS_TABLE,
+                                                                 chunkshape=chunkshape,
+                                                                 createparents=True)
+            # Preallocate buffer for a batch of rows
+            self._buffer = np.empty(shape=self.batch_size, dtype=self.columns)
+            self._write_row = self._write_row_tables
         else:
-            raise NotImplementedError(f"Output file type {self.out_type} not supported.")
+            # Rows are formatted batch-wise into an in-memory buffer and written at once. The buffered file passes
+            # large batches through directly and, unlike a raw file, writes all bytes of each batch.
+            # Exclusive creation fails if the file came into existence since initialization
+            self.file = open(self.out_file, mode='wb' if self.overwrite else 'xb')
+            self._csv_batch = io.StringIO()
+            self._writer[self.out_type] = csv.writer(self._csv_batch, quoting=self.csv_quoting, quotechar='#')
+            self._buffer = []
+            self._write_row = self._write_row_csv
+
+            self.file.write(self._header)
 
     def _close(self):
         """
         Close output file. Called from within __exit__ method
         """
         if self.file:
-            self.file.close()
+            try:
+                self.flush()
+            finally:
+                # An open file given to *open_group* is closed by its owner
+                if self._h5file is None:
+                    self.file.close()
+
+    def flush(self, durable=False):
+        """
+        Write all pending rows and flush *self.out_file*
+
+        Parameters
+        ----------
+        durable : bool, optional
+            Whether to additionally have the operating system write *self.out_file* to disk, by default False.
+            Costly, therefore only recommended every many rows
+        """
+        self._write_buffer()
+        self.file.flush()
+
+        if durable:
+            os.fsync(self.file.fileno())
+
+    def _write_buffer(self):
+        """
+        Write all rows buffered in *self._buffer* to *self.out_file* at once
+        """
+        if not self._n_buffered:
+            return
+
+        # Rows which could not be written are dropped instead of being written again with the next batch
+        try:
+            if self._is_tables:
+                self._append_rows(self._buffer[:self._n_buffered])
+            else:
+                self._append_rows(self._buffer)
+        finally:
+            if not self._is_tables:
+                self._buffer.clear()
+            self._n_buffered = 0
+
+    def _append_rows(self, rows):
+        """
+        Append *rows* to *self.out_file* at once
+
+        Parameters
+        ----------
+        rows : list of tuple, np.ndarray
+            Rows with values in the order of *self._col_names*
+        """
+        if self._is_tables:
+            self._writer[self.out_type].append(rows)
+        else:
+            # Still write the rows preceding a row which fails to be formatted
+            try:
+                self._writer[self.out_type].writerows(rows)
+            finally:
+                self.file.write(self._csv_batch.getvalue().encode())
+                self._csv_batch.seek(0)
+                self._csv_batch.truncate()
 
     def __enter__(self):
         """
@@ -184,38 +391,52 @@ class DataWriter:
         """
         self._close()
 
-    def _write_row(self, data_dict):
+    def _write_row_tables(self, row):
         """
-        Private method to write a row of data to the *self._out_file* with respect to *self.out_type*
+        Private method to write a row of data to the *self._out_file* for *self.out_type=TABLES*.
+        The row is buffered and the buffer is written once it holds *self.batch_size* rows
 
         Parameters
         ----------
-        data_dict : dict
-            Dictionary with columns names as keys and respective values
+        row : tuple
+            Values of the row in the order of *self._col_names*
+        """
 
-        Raises
-        ------
-        NotImplementedError
-            The *self.out_type* is not implemented
+        self._buffer[self._n_buffered] = row
+        self._n_buffered += 1
+        self._n_rows += 1
+
+        if self.flush_every and self._n_rows % self.flush_every == 0:
+            self.flush()
+        elif self._n_buffered == self.batch_size:
+            self._write_buffer()
+
+    def _write_row_csv(self, row):
         """
+        Private method to write a row of data to the *self._out_file* for *self.out_type=CSV*.
+        The row is buffered and the buffer is written once it holds *self.batch_size* rows
 
-        if self.out_type == self.TABLES:
-                for col, val in data_dict.items():
-                    self._writer[self.out_type].row[col] = val
-                self._writer[self.out_type].row.append()
-                self._writer[self.out_type].flush()
-            
-        elif self.out_type == self.CSV:
-            self._writer[self.out_type].writerow([data_dict[col] for col in self._col_names])
-        else:
-            raise NotImplementedError(f"Output file type {self.out_type} not supported.")
+        Parameters
+        ----------
+        row : tuple
+            Values of the row in the order of *self._col_names*
+        """
+
+        self._buffer.append(row)
+        self._n_buffered += 1
+        self._n_rows += 1
+
+        if self.flush_every and self._n_rows % self.flush_every == 0:
+            self.flush()
+        elif self._n_buffered == self.batch_size:
+            self._write_buffer()
 
     def write_row(self, *row_data, **row_items):
         """
         Method to write row data to *self.out_file* with respect to *self._out_type*.
         If *row_data* is given, it is expected to be in the correct order.
         If *row_items* is given, the keywords must be column names
-        Only one of the two must be used
+        Only one of the two must be used. Passing *row_data* is faster since it is written as is
 
         The following method calls produce the same result (with columns=["col1", "col2", "col3"]):
         
@@ -242,14 +463,202 @@ class DataWriter:
             if len(row_data) != len(self.columns):
                 raise ValueError("*write_row* method requires data for each column of the row!")
 
-            self._write_row(data_dict=dict(zip(self._col_names, row_data)))
+            self._write_row(row=row_data)
         
         else:
 
             if len(row_items) != len(self.columns):
                 raise ValueError("*write_row* method requires data for each column of the row!")
 
-            if not all(k in row_items for k in self._col_names):
+            try:
+                row = self._col_getter(row_items)
+            except KeyError:
+                raise KeyError("Column field is missing!")
+
+            self._write_row(row=row)
+
+    def _row_to_tuple(self, row):
+        """
+        Private method to convert a single row given to *write_rows* into a tuple in the order of *self._col_names*
+
+        Parameters
+        ----------
+        row : sequence, dict
+            Values of the row in the order of the columns or dict with column names as keys
+
+        Raises
+        ------
+        ValueError
+            *row* has not the same length as *self.columns*
+        KeyError
+            *row* is a dict which is missing a column
+        """
+
+        if len(row) != len(self.columns):
+            raise ValueError("*write_rows* method requires data for each column of each row!")
+
+        if isinstance(row, dict):
+            try:
+                return self._col_getter(row)
+            except KeyError:
                 raise KeyError("Column field is missing!")
 
-            self._write_row(data_dict=row_items)
+        return tuple(row)
+
+    def write_rows(self, rows):
+        """
+        Method to write multiple rows of data to *self.out_file* at once with respect to *self._out_type*.
+        Each row is either a sequence of values in the order of the columns or a dict with column names as keys.
+        A structured np.ndarray with the column names as fields is written as is.
+
+        The following method calls produce the same result (with columns=["col1", "col2", "col3"]):
+
+        # Use sequences
+        DataWriter.write_rows([(5, 7, 9), (6, 8, 10)])
+
+        # Use dicts
+        DataWriter.write_rows([dict(col1=5, col2=7, col3=9), dict(col2=8, col1=6, col3=10)])
+
+        Raises
+        ------
+        ValueError
+            A row has not the same length as *self.columns*
+        KeyError
+            A row is missing a column
+        """
+
+        if isinstance(rows, np.ndarray) and rows.dtype.names == tuple(self._col_names):
+            if not self._is_tables:
+                rows = rows.tolist()
+        elif self._is_tables:
+            # Convert to a structured array at once instead of leaving the conversion of the rows to PyTables
+            rows = np.fromiter((self._row_to_tuple(row) for row in rows), dtype=self.columns)
+        else:
+            rows = [self._row_to_tuple(row) for row in rows]
+
+        # Write pending rows first in order to keep the order of rows
+        self._write_buffer()
+        self._append_rows(rows)
+
+        n_rows = len(rows)
+
+        if self.flush_every and self._n_rows % self.flush_every + n_rows >= self.flush_every:
+            self.file.flush()
+
+        self._n_rows += n_rows
+
+    def write_columns(self, **col_arrays):
+        """
+        Method to write whole columns of data to *self.out_file* at once with respect to *self._out_type*.
+        The keywords must be the column names and all columns must have the same length.
+        Useful if the data of a measurement is already available as arrays, e.g. from a sweep.
+
+        The following method calls produce the same result (with columns=["col1", "col2", "col3"]):
+
+        # Use columns
+        DataWriter.write_columns(col1=[5, 6], col2=[7, 8], col3=[9, 10])
+
+        # Use rows
+        DataWriter.write_rows([(5, 7, 9), (6, 8, 10)])
+
+        Raises
+        ------
+        ValueError
+            - Given input has not the same length as *self.columns*
+            - The columns have different lengths
+        KeyError
+            *col_arrays* is missing a column
+        """
+
+        if len(col_arrays) != len(self.columns):
+            raise ValueError("*write_columns* method requires data for each column!")
+
+        try:
+            arrays = [np.asarray(col) for col in self._col_getter(col_arrays)]
+        except KeyError:
+            raise KeyError("Column field is missing!")
+
+        if len({len(arr) for arr in arrays}) > 1:
+            raise ValueError("*write_columns* method requires columns of the same length!")
+
+        # Combine into a structured array which *write_rows* writes as is
+        if self._is_tables:
+            rows = np.empty(shape=len(arrays[0]), dtype=self.columns)
+            for name, arr in zip(self._col_names, arrays):
+                rows[name] = arr
+        else:
+            rows = np.rec.fromarrays(arrays, names=list(self._col_names))
+
+        self.write_rows(rows)
+
+
+class H5Session:
+    """
+    Context manager holding a single HDF5 file open for writing the tables of multiple *DataWriter* instances.
+    Avoids opening and closing a file per measurement, e.g. for many consecutive sweeps:
+
+    with H5Session('sweeps.h5') as session:
+        for i in range(n_sweeps):
+            with session.writer(group_name=f'sweep_{i}', columns=columns) as writer:
+                writer.write_row(...)
+    """
+
+    def __init__(self, outfile, overwrite=False):
+        """
+        Parameters
+        ----------
+        outfile : str
+            Path to output file
+        overwrite : bool, optional
+            Whether to overwrite outfile if it already exists, by default False
+
+        Raises
+        ------
+        IOError
+            If *outfile* already exists and this instance is not allowed to overwrite
+        """
+
+        self.out_file = outfile
+        self.overwrite = overwrite
+
+        # Attribute for storing file handle
+        self.file = None
+
+        if not self.out_file.lower().endswith(DataWriter._FILE_EXTENSION[DataWriter.TABLES]):
+            self.out_file += DataWriter._FILE_EXTENSION[DataWriter.TABLES]
+
+        if os.path.isfile(self.out_file) and not self.overwrite:
+            msg = f"File {self.out_file} already exists."
+            msg += f"Initialize {type(self).__name__} with 'overwrite=True' if you wish to allow overwriting files."
+            raise IOError(msg)
+
+    def writer(self, group_name, columns, identifier='measurement', comments='', **kwargs):
+        """
+        Create a *DataWriter* writing to a new table in *group_name* of this session's file, see *DataWriter.open_group*
+
+        Returns
+        -------
+        DataWriter
+            Instance writing to this session's file
+        """
+        return DataWriter.open_group(h5file=self.file, group_name=group_name, columns=columns, identifier=identifier, comments=comments, **kwargs)
+
+    def __enter__(self):
+        """
+        Context manager entry point
+
+        Returns
+        -------
+        H5Session instance
+        """
+        # Atomically ensure the file did not come into existence since initialization; PyTables has no exclusive mode
+        if not self.overwrite:
+            os.close(os.open(self.out_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL))
+        self.file = tb.open_file(self.out_file, mode='w')
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_traceback):
+        """
+        Context manager exit point
+        """
+        self.file.close()
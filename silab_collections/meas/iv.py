@@ -9,37 +9,76 @@ import silab_collections.meas.smu as smu_utils
 from silab_collections.meas.data_writer import DataWriter
 from basil.dut import Dut
 from tqdm import tqdm
-from time import time, sleep, strftime
+from time import time, sleep, strftime, localtime
 
 
-def _measure_and_write_current(smu, n_meas, bias, writer, pbar, log):
+# Plus-minus sign for displaying uncertainties
+PLUSMINUS = u'\u00B1'
+
+
+def _exceeds_current_limit(current, current_limit):
+    # Overflow readings do not count as exceeding the current limit; works on single currents and arrays
+    return (np.abs(current) > abs(current_limit)) & (current < smu_utils.OVERFLOW_READING)
+
+
+def _measure_and_write_current(smu, n_meas, bias, writer, pbar, log, buf=None, current_limit=None):
 
     # We only take one measurement
     if n_meas == 1:
         current = smu_utils.get_current_reading(smu=smu)
-        writer.write_row(timestamp=time(), bias=bias, current=current)
+        timestamp = time()
+        row = (timestamp, bias, current)
         current_str = f'Current={current:.3E}A'
     
     # Take n_meas > 1 measurements
     else:
-        current = np.zeros(shape=n_meas, dtype=float)
-        for i in range(n_meas):
-            current[i] = smu_utils.get_current_reading(smu=smu)
-            sleep(meas.MEAS_DELAY)
+        currents = smu_utils.read_current_burst(smu=smu, n_meas=n_meas, delay=meas.MEAS_DELAY, out=buf)
+        current, std_current = currents.mean(), currents.std()
+        timestamp = time()
+        row = (timestamp, bias, current, std_current)
+        current_str = f'Current=({current:.3E}{PLUSMINUS}{std_current:.3E})A'
 
-        writer.write_row(timestamp=time(), bias=bias, mean_current=current.mean(), std_current=current.std())
-        current_str = 'Current=({:.3E}{}{:.3E})A'.format(current.mean(), u'\u00B1', current.std())
+    # A (mean) current exceeding *current_limit* is not written, as in _sweep_and_write_current
+    if current_limit is None or not _exceeds_current_limit(current, current_limit):
+        writer.write_row(*row)
 
     # Update progressbars poststr
     pbar.set_postfix_str(current_str)
 
     if log:
         # Construct string
-        log = 'INFO @ {} -> Bias={:.3f}V, {}'.format(strftime('%d-%m-%Y %H:%M:%S'), bias, current_str)
-        pbar.write(log)
+        log_str = f"INFO @ {strftime('%d-%m-%Y %H:%M:%S', localtime(timestamp))} -> Bias={bias:.3f}V, {current_str}"
+        pbar.write(log_str)
+
+    return current, timestamp
+
+
+def _sweep_and_write_current(smu, bias_volts, current_limit, writer, log):
+
+    tqdm.write(f"Sweeping {len(bias_volts)} bias voltages on the SMU...")
+
+    start = time()
+    currents, times = smu_utils.run_sweep(smu=smu, bias_volts=bias_volts, settle_delay=meas.BIAS_SETTLE_DELAY)
+
+    timestamps = start + times
+
+    # Only keep measurements until the current limit was exceeded
+    exceeded = np.flatnonzero(_exceeds_current_limit(currents, current_limit))
+    n_valid = exceeded[0] if len(exceeded) else len(currents)
+
+    writer.write_columns(timestamp=timestamps[:n_valid], bias=bias_volts[:n_valid], current=currents[:n_valid])
+
+    if log:
+        for timestamp, bias, current in zip(timestamps[:n_valid], bias_volts[:n_valid], currents[:n_valid]):
+            # Construct string
+            log_str = 'INFO @ {} -> Bias={:.3f}V, Current={:.3E}A'.format(strftime('%d-%m-%Y %H:%M:%S', localtime(timestamp)), bias, current)
+            tqdm.write(log_str)
+
+    if n_valid < len(currents):
+        warnings.warn(f"Current limit exceeded with {currents[n_valid]:.2E} A. Abort.", Warning)
 
 
-def iv_scan(outfile, iv_setup, bias_voltage, current_limit, bias_polarity=1, bias_steps=None, n_meas=1, smu_name=None, log_progress=False, linger=False, **writer_kwargs):
+def iv_scan(outfile, iv_setup, bias_voltage, current_limit, bias_polarity=1, bias_steps=None, n_meas=1, smu_name=None, log_progress=False, linger=False, smu_sweep=False, **writer_kwargs):
     """
     Basic IV scan using a single source-measure unit (SMU).
 
@@ -52,7 +91,7 @@ def iv_scan(outfile, iv_setup, bias_voltage, current_limit, bias_polarity=1, bia
     bias_voltage : float, int
         Maximum voltage to which the bias voltage is ramped
     current_limit : float
-        Absolute current limit in A
+        Absolute current limit in A. The scan stops at the first (mean) current exceeding it, which is not written to *outfile*
     bias_polarity : int, optional
         Bias voltage polarity, - 1 if *bias_polarity* < 0 else 1, by default 1
     bias_steps : int, optional
@@ -65,6 +104,10 @@ def iv_scan(outfile, iv_setup, bias_voltage, current_limit, bias_polarity=1, bia
         Whether to print the measurements of each voltage step persistently over the progressbar
     linger : bool, float, optional
         Whether to continue measuring IV when the *bias_voltage* has been reached. If True, measure until user interrupt, else measure *linger* seconds
+    smu_sweep : bool, optional
+        Whether to let the SMU sweep through the bias voltages itself and read back all currents at once, by default False.
+        Only applies if smu_utils.supports_sweep(smu), *n_meas* == 1 and *linger* is False. During the sweep,
+        the current is limited by the SMU compliance; exceeding *current_limit* is checked afterwards
     """
 
     # We already have an initialized DUT
@@ -101,7 +144,7 @@ def iv_scan(outfile, iv_setup, bias_voltage, current_limit, bias_polarity=1, bia
         writer_kwargs['comments'] = [f'SMU: {smu.get_name().strip()}',
                                      f'Current limit: {current_limit:.2E} A',
                                      f'Measurements per voltage step: {n_meas}',
-                                     f"Bias voltages: ({', '.join(str(bv) for bv in bias_volts)}) V"]
+                                     f"Bias voltages: {np.array2string(bias_volts, separator=', ', threshold=20, max_line_width=np.inf)} V"]
     
     # Don't allow the user to set the columns
     writer_kwargs['columns'] = ['timestamp', 'bias', 'current'] if n_meas == 1 else ['timestamp', 'bias', 'mean_current', 'std_current']
@@ -109,6 +152,10 @@ def iv_scan(outfile, iv_setup, bias_voltage, current_limit, bias_polarity=1, bia
     if 'outtype' in writer_kwargs and writer_kwargs['outtype'] == DataWriter.TABLES:
         writer_kwargs['columns'] = np.dtype(list(zip(writer_kwargs['columns'], [float] * len(writer_kwargs['columns']))))
 
+    # We write one row per bias voltage; when lingering, the number of rows is open-ended
+    if not linger:
+        writer_kwargs.setdefault('expected_rows', len(bias_volts))
+
     # Make instance of data writer
     data_writer = DataWriter(outfile=outfile, **writer_kwargs)
 
@@ -117,11 +164,25 @@ def iv_scan(outfile, iv_setup, bias_voltage, current_limit, bias_polarity=1, bia
 
     # Ensure we start from 0 volts
     smu_utils.ramp_voltage(smu=smu, target_voltage=0)
+
+    # Check whether the SMU can sweep through the bias voltages itself
+    use_smu_sweep = smu_sweep and n_meas == 1 and not linger and smu_utils.supports_sweep(smu)
     
+    # Preallocate buffer for the measurements per voltage step once
+    meas_buf = np.empty(shape=n_meas, dtype=float) if n_meas > 1 else None
+
     try:
 
         with data_writer as writer:
 
+            if use_smu_sweep:
+                _sweep_and_write_current(smu=smu, bias_volts=bias_volts, current_limit=current_limit, writer=writer, log=log_progress)
+                # Scan is done; ramping down and turning off the SMU is handled in the finally clause
+                return
+
+            # Hoist constants of the current limit check
+            abs_limit, overflow = abs(current_limit), smu_utils.OVERFLOW_READING
+
             # Make progress bar to loop over voltage steps
             pbar_volts = tqdm(bias_volts, unit='bias voltage', desc='IV curve basic')
 
@@ -129,23 +190,19 @@ def iv_scan(outfile, iv_setup, bias_voltage, current_limit, bias_polarity=1, bia
             for bias in pbar_volts:
                 
                 # Set next voltage
-                smu.set_voltage(bias)
-                
-                # Short sleep to prevent wrong read of compliance limit off of SMU
-                sleep(0.1)
-    
-                # Read current 
-                current = smu_utils.get_current_reading(smu=smu)
-
-                # Check if we are above the current limit
-                if abs(current) > abs(current_limit) and current < 1e37:
-                    warnings.warn(f"Current limit exceeded with {current:.2E} A. Abort.", Warning)
-                    break
+                smu_utils.set_voltage(smu=smu, voltage=bias)
                 
                 # Let the voltage settle
                 sleep(meas.BIAS_SETTLE_DELAY)
             
-                _measure_and_write_current(smu=smu, n_meas=n_meas,bias=bias, writer=writer, pbar=pbar_volts, log=log_progress)
+                current, _ = _measure_and_write_current(smu=smu, n_meas=n_meas, bias=bias, writer=writer, pbar=pbar_volts, log=log_progress, buf=meas_buf, current_limit=current_limit)
+
+                # Check if we are above the current limit; overflow readings do not count as exceeding it
+                if current < -abs_limit or abs_limit < current < overflow:
+                    warnings.warn(f"Current limit exceeded with {current:.2E} A. Abort.", Warning)
+                    break
+                elif current >= overflow:
+                    warnings.warn(f"Current reading overflow ({current:.2E}) @ {bias} V.", Warning)
 
             # Loop did not break so there is no current exceeded
             else:
@@ -157,29 +214,25 @@ def iv_scan(outfile, iv_setup, bias_voltage, current_limit, bias_polarity=1, bia
                     
                     # We linger for fixed amount of seconds
                     if type(linger) in (int, float):
-                        start = time()
-                        condition = lambda: time() - start <= linger 
+                        end = time() + linger
                         description = f"Linger for {linger} seconds @ {bias} V..."
                     # We liner indefinetely
                     elif type(linger) is bool:
-                        condition = lambda: True
+                        end = float('inf')
                         description = f"Linger indefinetely @ {bias} V..."
                     else:
                         raise ValueError("*Linger* needs to be bool or number of seconds")
 
-                    # Generator for tqdm yielding while *cond* is true
-                    def linger_loop(cond):
-                        while cond():
-                            yield
-
-                    # Make progresbar
-                    pbar_linger = tqdm(linger_loop(cond=condition), unit=' Measurements', desc=description)
+                    # Make progresbar; throttle its updates since there is no total
+                    pbar_linger = tqdm(unit=' Measurements', desc=description, mininterval=0.5, maxinterval=2)
                     pbar_linger.write("Press CTRL-C to exit...")
 
-                    # Start lingering
+                    # Start lingering; the timestamp of each measurement is reused to check the end
                     try:
-                        for _ in pbar_linger:
-                            _measure_and_write_current(smu=smu, n_meas=n_meas,bias=bias, writer=writer, pbar=pbar_linger, log=log_progress)
+                        timestamp = time()
+                        while timestamp <= end:
+                            _, timestamp = _measure_and_write_current(smu=smu, n_meas=n_meas, bias=bias, writer=writer, pbar=pbar_linger, log=log_progress, buf=meas_buf)
+                            pbar_linger.update()
                         pbar_linger.close()
                     except KeyboardInterrupt:
                         pass
@@ -193,7 +246,8 @@ def iv_scan(outfile, iv_setup, bias_voltage, current_limit, bias_polarity=1, bia
         # Ensure we go back to 0 volts with the same stepping as IV measurements
         smu_utils.ramp_voltage(smu=smu, target_voltage=0, steps=len(bias_volts))
 
-        smu_utils.call_method_if_exists(smu, 'off')
+        if smu_utils.describe_smu(smu).has_off:
+            smu.off()
 
         if _close_dut:
             dut.close()
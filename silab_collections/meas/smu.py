@@ -3,9 +3,10 @@ Script containing SMU-related functionality
 """
 
 import numpy as np
+from collections.abc import Iterable
+from dataclasses import dataclass
 from tqdm import tqdm
 from time import sleep
-from collections.abc import Iterable
 
 
 def call_method_if_exists(smu, method, *args, **kwargs):
@@ -17,66 +18,369 @@ def call_method_if_exists(smu, method, *args, **kwargs):
         pass
 
 
+@dataclass(frozen=True)
+class SMUCapabilities:
+    """
+    Optional methods available on a SMU, see describe_smu
+    """
+    has_source_volt: bool
+    has_set_current_limit: bool
+    has_set_voltage_range: bool
+    has_get_on: bool
+    has_on: bool
+    has_off: bool
+
+
+def _has_method(smu, method):
+
+    # SCPI devices define their commands in a dict and return a callable for any unknown attribute
+    scpi_commands = vars(smu).get('_scpi_commands')
+    if scpi_commands is not None:
+        return method in scpi_commands or callable(getattr(type(smu), method, None))
+
+    return callable(getattr(smu, method, None))
+
+
+def describe_smu(smu):
+    """
+    Determines which optional methods are available on the *smu*.
+    The result is determined once and stored on the *smu*.
+
+    Parameters
+    ----------
+    smu : basil.dut.Dut.HardwareLayer
+        Harwdare layer of the SMU
+
+    Returns
+    -------
+    SMUCapabilities
+        Available optional methods of the *smu*
+    """
+
+    if '_caps' not in vars(smu):
+        smu._caps = SMUCapabilities(**{f'has_{method}': _has_method(smu, method)
+                                       for method in ('source_volt', 'set_current_limit', 'set_voltage_range', 'get_on', 'on', 'off')})
+
+    return smu._caps
+
+
 def get_smu_type(smu):
+
+    # Querying the name is a round-trip to the device, therefore the type is determined once and stored on the smu.
+    # Check the instance dict directly since basil hardware layers return a callable for any unknown attribute
+    if '_smu_type' not in vars(smu):
         basil_identifier = smu.get_name().split(',')
         if len(basil_identifier) > 1:
             vendor = basil_identifier[0].split(' ')[0].upper()
             model = basil_identifier[1].split(' ')[-1].upper()
-            return f'{vendor}_{model}'
+            smu._smu_type = f'{vendor}_{model}'
         else:
-            return None
+            smu._smu_type = None
 
+    return smu._smu_type
 
-def get_current_reading(smu):
 
-    # Life is easier with formatting
-    if hasattr(smu, 'has_formatting') and smu.has_formatting:
-        if not smu.formatting_enabled:
+def _uses_formatting(smu):
+
+    # Determine once per smu whether basil formats its readings and enable formatting if so
+    if '_uses_formatting' not in vars(smu):
+        uses_formatting = hasattr(smu, 'has_formatting') and bool(smu.has_formatting)
+        if uses_formatting and not smu.formatting_enabled:
             smu.enable_formatting()
-        return float(smu.get_current())
+        smu._uses_formatting = uses_formatting
+
+    return smu._uses_formatting
+
+
+def _make_current_reader(smu):
+
+    # Life is easier with formatting
+    if _uses_formatting(smu):
+        return lambda get_current=smu.get_current: float(get_current())
+
+    # Specifiy different smu type responses here; if not specified expect smu has get_current return value
+    typ = get_smu_type(smu)
+    if typ == 'KEITHLEY_2410':
+        return lambda get_current=smu.get_current: float(get_current().split(',', 2)[1])
+    elif typ == 'KEITHLEY_6517A':
+        return lambda get_read=smu.get_read: float(get_read().split(',', 1)[0][:-4])
     else:
-        # Specifiy different smu type responses here; if not specified expect smu has get_current return value
-        typ = get_smu_type(smu)
-        if typ == 'KEITHLEY_2410':
-            return float(smu.get_current().split(',')[1])
-        elif typ == 'KEITHLEY_6517A':
-            return float(smu.get_read().split(',')[0][:-4])
-        else:
-            return float(smu.get_current())
+        return lambda get_current=smu.get_current: float(get_current())
 
 
-def get_voltage_reading(smu):
+def _make_voltage_reader(smu):
 
     # Life is easier with formatting
-    if hasattr(smu, 'has_formatting') and smu.has_formatting:
-        if not smu.formatting_enabled:
-            smu.enable_formatting()
-        return float(smu.get_voltage())
+    if _uses_formatting(smu):
+        return lambda get_voltage=smu.get_voltage: float(get_voltage())
+
+    typ = get_smu_type(smu)
+    if typ == 'KEITHLEY_2410':
+        return lambda get_voltage=smu.get_voltage: float(get_voltage().split(',', 1)[0])
     else:
-        typ = get_smu_type(smu)
-        if typ == 'KEITHLEY_2410':
-            return float(smu.get_voltage().split(',')[0])
-        elif typ == 'KEITHLEY_6517A':
-            return float(smu.get_voltage())
+        return lambda get_voltage=smu.get_voltage: float(get_voltage())
+
+
+def _make_voltage_setter(smu):
+
+    # For SCPI devices, write the command from the command table directly instead of resolving it on each call,
+    # unless the hardware layer implements set_voltage itself, e.g. with formatting or device specific handling
+    scpi_commands = vars(smu).get('_scpi_commands')
+    if scpi_commands is not None and 'set_voltage' in scpi_commands and not callable(getattr(type(smu), 'set_voltage', None)):
+        return lambda voltage, write=smu._intf.write, cmd=scpi_commands['set_voltage'] + ' %.6E': write(cmd % voltage)
+    else:
+        return smu.set_voltage
+
+
+def get_current_reading(smu):
+
+    # The reader parsing the response of the respective smu type is created once and stored on the smu
+    if '_read_current' not in vars(smu):
+        smu._read_current = _make_current_reader(smu)
+
+    return smu._read_current()
+
+
+def get_voltage_reading(smu):
+
+    # The reader parsing the response of the respective smu type is created once and stored on the smu
+    if '_read_voltage' not in vars(smu):
+        smu._read_voltage = _make_voltage_reader(smu)
+
+    return smu._read_voltage()
+
+
+def set_voltage(smu, voltage):
+    """
+    Sets the *voltage* of the *smu* and keeps track of it in software,
+    such that ramp_voltage does not need to read the voltage off of the *smu*.
+    Voltages should therefore always be set via this function.
+
+    Parameters
+    ----------
+    smu : basil.dut.Dut.HardwareLayer
+        Harwdare layer of the SMU
+    voltage : float
+        Voltage in V
+    """
+
+    # The setter writing the respective command is created once and stored on the smu
+    if '_write_voltage' not in vars(smu):
+        smu._write_voltage = _make_voltage_setter(smu)
+
+    smu._write_voltage(voltage)
+    smu._last_voltage = voltage
+
+
+def _tracked_voltage(smu):
+    # Voltage last set via set_voltage; only read it off of the smu if it was not set via set_voltage before
+    if '_last_voltage' not in vars(smu):
+        smu._last_voltage = get_voltage_reading(smu=smu)
+
+    return smu._last_voltage
+
+# Readings at or above are overflows rather than currents, e.g. 9.91e37 of Keithley SMUs
+OVERFLOW_READING = 1e37
+
+# SMU types supporting voltage sweeps programmed on the SMU itself, see run_sweep
+SWEEP_SMU_TYPES = ('KEITHLEY_2400', 'KEITHLEY_2410')
+
+# Maximum number of points in the source list of the Keithley 2400 series
+_KEITHLEY_2400_LIST_POINTS = 100
+
+# Maximum number of points of a linear sweep of the Keithley 2400 series, see _sweep_voltage
+_KEITHLEY_2400_SWEEP_POINTS = 2500
+
+# Default elements of a reading of the Keithley 2400 series
+_KEITHLEY_2400_FORM_ELEM = 'VOLT,CURR,RES,TIME,STAT'
+
+
+def supports_sweep(smu):
+    """
+    Whether the *smu* can run voltage sweeps and buffered readings itself, see run_sweep and read_current_burst.
+    The *smu* type must be in SWEEP_SMU_TYPES and its readings must not be formatted by basil
+    """
+    return get_smu_type(smu) in SWEEP_SMU_TYPES and not _uses_formatting(smu)
+
+
+def run_sweep(smu, bias_volts, settle_delay):
+    """
+    Sweeps the voltage of the *smu* through *bias_volts* using the source list of the *smu* itself
+    and reads back all currents at once instead of setting and reading each voltage step separately.
+    The *smu* waits *settle_delay* seconds after each voltage step before measuring.
+    After the sweep, the *smu* stays at the last swept voltage in fixed source mode.
+
+    Parameters
+    ----------
+    smu : basil.dut.Dut.HardwareLayer
+        Harwdare layer of the SMU for which supports_sweep(smu) is True
+    bias_volts : np.array
+        Voltages to sweep through
+    settle_delay : float
+        Delay after each voltage step before measuring in seconds
+
+    Raises
+    ------
+    NotImplementedError
+        The type of *smu* does not support sweeps
+    RuntimeError
+        The *smu* did not return a current and time reading for each voltage step
+
+    Returns
+    -------
+    tuple of np.array
+        Currents in A and times of the measurements in seconds since the start of the sweep
+    """
+
+    if not supports_sweep(smu):
+        raise NotImplementedError(f"Sweeps are only supported for unformatted SMU types {', '.join(SWEEP_SMU_TYPES)}")
+
+    readings = []
+    last_voltage = None
+
+    # Only read back current and time, starting the time at 0
+    for cmd in (":SENS:FUNC 'CURR'", ':FORM:ELEM CURR,TIME', ':SYST:TIME:RES', f':SOUR:DEL {settle_delay}', ':SOUR:VOLT:MODE LIST'):
+        smu._intf.write(cmd)
+
+    try:
+        # The source list holds a limited number of points, so sweep in chunks
+        for i in range(0, len(bias_volts), _KEITHLEY_2400_LIST_POINTS):
+            volts = bias_volts[i:i + _KEITHLEY_2400_LIST_POINTS]
+            smu._intf.write(':SOUR:LIST:VOLT ' + ','.join(f'{v:.6E}' for v in volts))
+            smu._intf.write(f':TRIG:COUN {len(volts)}')
+            smu._intf.write(':INIT')
+            # Wait for the sweep in software to not run into the timeout of the transfer layer on *OPC?
+            sleep(len(volts) * settle_delay)
+            smu._intf.query('*OPC?')
+            chunk = np.fromstring(smu._intf.query(':FETC?'), sep=',')
+            # One current and time per voltage step
+            if chunk.size != 2 * len(volts):
+                raise RuntimeError(f"Sweep returned {chunk.size} instead of {2 * len(volts)} readings "
+                                   f"for {len(volts)} voltage steps")
+            readings.append(chunk)
+            last_voltage = float(volts[-1])
+    finally:
+        # The fixed source voltage is applied when returning to fixed mode; keep the last swept voltage
+        if last_voltage is not None:
+            smu._intf.write(f':SOUR:VOLT:LEV {last_voltage:.6E}')
+            smu._last_voltage = last_voltage
+        else:
+            # Nothing was swept completely, so the applied voltage is unknown
+            vars(smu).pop('_last_voltage', None)
+
+        # Restore fixed source mode and default settings
+        for cmd in (':SOUR:VOLT:MODE FIX', ':TRIG:COUN 1', ':SOUR:DEL:AUTO ON', f':FORM:ELEM {_KEITHLEY_2400_FORM_ELEM}'):
+            smu._intf.write(cmd)
+
+    readings = np.concatenate(readings)
+
+    return readings[0::2], readings[1::2]
+
+
+def _sweep_voltage(smu, start, stop, num, delay):
+    """
+    Sweeps the voltage of the *smu* linearly from *start* to *stop* in *num* steps with *delay* seconds
+    in between, using the sweep of the *smu* itself. Blocks until the sweep is complete.
+    Afterwards, the *smu* stays at *stop* in fixed source mode. *num* must not exceed _KEITHLEY_2400_SWEEP_POINTS.
+
+    Raises
+    ------
+    RuntimeError
+        The sweep did not end at *stop*, e.g. because the *smu* rejected the sweep settings
+    """
+
+    # Switch to sweep mode first; the output does not change before the sweep is triggered
+    for cmd in (':SOUR:VOLT:MODE SWE', f':SOUR:VOLT:STAR {start:.6E}', f':SOUR:VOLT:STOP {stop:.6E}',
+                f':SOUR:SWE:POIN {num}', f':SOUR:DEL {delay}', f':TRIG:COUN {num}', ':FORM:ELEM VOLT'):
+        smu._intf.write(cmd)
+
+    swept = False
+    try:
+        smu._intf.write(':INIT')
+        # Wait for the sweep in software to not run into the timeout of the transfer layer on *OPC?
+        sleep(num * delay)
+        smu._intf.query('*OPC?')
+
+        # Read back the swept voltages to verify the sweep actually reached *stop* before applying it as fixed level
+        volts = np.fromstring(smu._intf.query(':FETC?'), sep=',')
+        if volts.size != num or not np.isclose(volts[-1], stop, atol=1):
+            raise RuntimeError(f"Sweeping voltage from {start} V to {stop} V in {num} steps failed. "
+                               f"({volts.size} readings, {volts[-1] if volts.size else None} V after sweeping)")
+        swept = True
+    finally:
+        # The fixed source voltage is applied when returning to fixed mode; only set it once the sweep reached *stop*
+        if swept:
+            smu._intf.write(f':SOUR:VOLT:LEV {stop:.6E}')
+            smu._last_voltage = stop
         else:
-            return float(smu.get_voltage())
+            # The sweep was interrupted, so the applied voltage is unknown
+            vars(smu).pop('_last_voltage', None)
+
+        # Restore fixed source mode and default settings
+        for cmd in (':SOUR:VOLT:MODE FIX', ':TRIG:COUN 1', ':SOUR:DEL:AUTO ON', f':FORM:ELEM {_KEITHLEY_2400_FORM_ELEM}'):
+            smu._intf.write(cmd)
+
+
+def read_current_burst(smu, n_meas, delay, out=None):
+    """
+    Takes *n_meas* current readings of the *smu* with *delay* seconds before each reading.
+    If supports_sweep(smu), the readings are triggered and buffered by the *smu* itself and read back at once.
+    Otherwise, each reading is taken separately.
+
+    Parameters
+    ----------
+    smu : basil.dut.Dut.HardwareLayer
+        Harwdare layer of the SMU
+    n_meas : int
+        Number of current readings
+    delay : float
+        Delay before each reading in seconds
+    out : np.array, optional
+        Array of shape (*n_meas*,) to write the currents to, e.g. to reuse it for consecutive calls, by default None
+
+    Returns
+    -------
+    np.array
+        Currents in A; *out* if given
+    """
+
+    currents = np.empty(shape=n_meas, dtype=float) if out is None else out
+
+    if supports_sweep(smu):
+        try:
+            smu._intf.write(f":SENS:FUNC 'CURR';:FORM:ELEM CURR;:TRIG:DEL {delay};:TRIG:COUN {n_meas};:INIT")
+            # Wait for the readings in software to not run into the timeout of the transfer layer on *OPC?
+            sleep(n_meas * delay)
+            smu._intf.query('*OPC?')
+            readings = smu._intf.query(':FETC?')
+        finally:
+            smu._intf.write(f':TRIG:COUN 1;:TRIG:DEL 0;:FORM:ELEM {_KEITHLEY_2400_FORM_ELEM}')
+        currents[:] = np.fromstring(readings, sep=',')
+        return currents
+
+    for i in range(n_meas):
+        sleep(delay)
+        currents[i] = get_current_reading(smu=smu)
+
+    return currents
+
 
 def generate_bias_volts(bias, steps=None, polarity=1, check_monotonic=True):
     """
     Create and return a np.array of bias voltages.
-    If step is None and bias is a number, np.linspace is used and creates *bias* voltages.
-    If *bias* is already an iterable of voltages, checks are performed.
+    If step is None and bias is a number, voltages from 0 to *bias* in steps of 1 V are created.
+    If *bias* is already an array-like of voltages, checks are performed.
 
     Parameters
     ----------
-    bias : float, int, Iterable of float/int
+    bias : float, int, array-like of float/int
         Bias voltage(s)
     steps : int, None
         Number of steps to generate for bias, by default None.
     polarity : int
         Polarity of the bias viltage; either -1 or +1
     check_monotonic : bool
-        Whether to check if the *bias* input is monotonic; only applies if *bias* is an Iterable
+        Whether to check if the *bias* input is monotonic; only applies if *bias* is an array-like
 
     Raises
     ------
@@ -89,32 +393,40 @@ def generate_bias_volts(bias, steps=None, polarity=1, check_monotonic=True):
         Array of bias voltages
     """
 
-    is_monotonic = lambda a: all(a[i] <= a[i+1] for i in range(len(a)-1)) or all(a[i] >= a[i+1] for i in range(len(a)-1))
+    # Materialize generic iterables such as generators; lists, tuples and arrays are taken as they are
+    if not isinstance(bias, (list, tuple, np.ndarray)) and isinstance(bias, Iterable) and not isinstance(bias, str):
+        bias = list(bias)
 
     # Create voltage steps etc.
-    if isinstance(bias, Iterable):
+    if np.ndim(bias) > 0:
         try:
-            bias_volts = np.array([float(bv) * polarity for bv in bias])
+            bias_volts = np.asarray(bias, dtype=float) * polarity
         except ValueError:
             raise ValueError("*bias* must be iterable of voltages convertable to floats")
 
-        if check_monotonic and not is_monotonic(bias_volts):
-            raise ValueError("*bias* iterable is not monotonic. Set check_monotonic=False to skip this check")
+        if check_monotonic:
+            volt_diffs = np.diff(bias_volts)
+            if not (np.all(volt_diffs >= 0) or np.all(volt_diffs <= 0)):
+                raise ValueError("*bias* iterable is not monotonic. Set check_monotonic=False to skip this check")
     else:
         bias_polarity = 1 if polarity >= 0 else -1
         max_bias = bias_polarity * bias
-        if steps is None:
-            bias_volts = np.linspace(0, max_bias, int(abs(max_bias)+1))
+        # Integer voltages can be stepped exactly in 1 V steps
+        if steps is None and float(max_bias).is_integer():
+            step = 1.0 if max_bias >= 0 else -1.0
+            bias_volts = np.arange(0, max_bias + step, step)
         else:
-            bias_volts = np.linspace(0, max_bias, int(steps))
+            num = int(abs(max_bias)) + 1 if steps is None else int(steps)
+            bias_volts = np.linspace(0, max_bias, num, dtype=np.float64)
 
     return bias_volts
 
-def setup_voltage_source(smu, bias_voltage, current_limit):
+def setup_voltage_source(smu, bias_voltage, current_limit, ramp_step=10, ramp_delay=0.2):
     """
     Sets up the *smu* to provide a voltage source.
     Set SMU-specific parameters such as the operating voltage range
     as well as the current compliance limit.
+    If the *smu* is already on, its voltage is ramped down to 0 V first.
 
     Parameters
     ----------
@@ -124,27 +436,40 @@ def setup_voltage_source(smu, bias_voltage, current_limit):
         Voltage(s) of which the maximum is determined to set the range
     current_limit : float, int
         Current compliance limit in A
+    ramp_step : float, optional
+        Approximate voltage step in V when ramping down to 0 V, using at least 10 steps, by default 10
+    ramp_delay : float, optional
+        Delay in between voltage steps in seconds when ramping down to 0 V, by default 0.2
     """
 
     # Adjust the SMU from basil if possible
+    caps = describe_smu(smu)
+
     # Ensure we are in voltage sourcing mode
-    call_method_if_exists(smu, 'source_volt')
+    if caps.has_source_volt:
+        smu.source_volt()
     
     # Ensure compliance limit
-    call_method_if_exists(smu, 'set_current_limit', current_limit)
+    if caps.has_set_current_limit:
+        smu.set_current_limit(current_limit)
 
     # Ensure voltage range
-    call_method_if_exists(smu, 'set_voltage_range', float(np.max(np.abs(bias_voltage)) if isinstance(bias_voltage, Iterable) else np.abs(bias_voltage)))
+    if caps.has_set_voltage_range:
+        smu.set_voltage_range(float(np.max(np.abs(bias_voltage))))
 
     # Check if smu is already on
-    smu_is_on = call_method_if_exists(smu, 'get_on')
-    if smu_is_on is not None and bool(int(smu_is_on.strip())):
-        # If smu is already on we want to ramp down to 0 volt
-        ramp_voltage(smu, delay=0.2)
+    if caps.has_get_on and bool(int(smu.get_on().strip())):
+        # If smu is already on we want to ramp down to 0 volt; read the voltage once per setup since it may have
+        # been changed in between scans, e.g. manually or by another script
+        smu._last_voltage = get_voltage_reading(smu=smu)
+        steps = max(10, int(abs(smu._last_voltage) / ramp_step))
+        ramp_voltage(smu, target_voltage=0, delay=ramp_delay, steps=steps)
     # if we cannot tell, just ramp to 0 and turn on
     else:
         call_method_if_exists(smu, 'set_voltage', 0)
-        call_method_if_exists(smu, 'on')
+        smu._last_voltage = 0
+        if caps.has_on:
+            smu.on()
 
 
 def ramp_voltage(smu, target_voltage=0, delay=1, steps=None):
@@ -168,39 +493,45 @@ def ramp_voltage(smu, target_voltage=0, delay=1, steps=None):
         SMU does not have voltage getter/setter
     """
 
-    smu_is_on = call_method_if_exists(smu, 'get_on')
-    if smu_is_on is not None:
-        if not int(smu_is_on.strip()):
-            call_method_if_exists(smu, 'on')
+    caps = describe_smu(smu)
+    if caps.has_get_on and caps.has_on:
+        if not int(smu.get_on().strip()):
+            smu.on()
 
     # Get the current voltage
-    current_voltage = get_voltage_reading(smu=smu)
+    current_voltage = _tracked_voltage(smu=smu)
 
-    # If we are already at the aim voltage, return
-    if  current_voltage == target_voltage:
-        return
+    # If we are seemingly at the aim voltage already, verify and return
+    if current_voltage == target_voltage:
+        current_voltage = smu._last_voltage = get_voltage_reading(smu=smu)
+        if np.isclose(current_voltage, target_voltage, atol=1):
+            return
 
-    # Create voltages to loop through
-    if steps is None:
-        volts = np.linspace(current_voltage, target_voltage, int(abs(target_voltage-current_voltage)+2)) 
-    else:
-        volts = np.linspace(current_voltage, target_voltage, int(steps))
-    
-    # Make progressbar
-    pbar_ramp = tqdm(volts, unit='voltage steps', desc=f'Ramping voltage to {target_voltage} V')
-    
-    for v in pbar_ramp:
-        # Set voltage
-        smu.set_voltage(v)
+    num = int(abs(target_voltage - current_voltage)) + 2 if steps is None else int(steps)
 
-        # Update pbar text
-        pbar_ramp.set_postfix_str(f'Voltage={v:.2f}V')
+    # Let the smu ramp itself if possible; a sweep needs at least 2 and at most _KEITHLEY_2400_SWEEP_POINTS points
+    if supports_sweep(smu) and num <= _KEITHLEY_2400_SWEEP_POINTS:
+        _sweep_voltage(smu=smu, start=current_voltage, stop=target_voltage, num=max(num, 2), delay=delay)
+    else:
+        # Create voltages to loop through
+        volts = np.linspace(current_voltage, target_voltage, num, dtype=np.float64)
         
-        # Wait
-        sleep(delay)
-
-    # Get the current voltage
-    current_voltage = get_voltage_reading(smu=smu)
-
-    if not np.isclose(current_voltage, target_voltage, atol=1):
-        raise RuntimeError(f"Ramping voltage to target of {target_voltage} V failed. ({current_voltage} V after ramping.")
+        # Make progressbar
+        pbar_ramp = tqdm(volts, unit='voltage steps', desc=f'Ramping voltage to {target_voltage} V')
+        
+        for v in pbar_ramp:
+            # Set voltage
+            set_voltage(smu=smu, voltage=v)
+
+            # Update pbar text
+            pbar_ramp.set_postfix_str(f'Voltage={v:.2f}V')
+            
+            # Wait
+            sleep(delay)
+
+    # Verify the voltage after non-trivial ramps
+    if delay > 0:
+        current_voltage = get_voltage_reading(smu=smu)
+
+        if not np.isclose(current_voltage, target_voltage, atol=1):
+            raise RuntimeError(f"Ramping voltage to target of {target_voltage} V failed. ({current_voltage} V after ramping.")
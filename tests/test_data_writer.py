@@ -0,0 +1,206 @@
+import csv
+
+import numpy as np
+import pytest
+import tables as tb
+
+from silab_collections.meas.data_writer import DataWriter, H5Session
+
+
+COLUMNS = ['timestamp', 'bias', 'current']
+DTYPE = np.dtype([(name, float) for name in COLUMNS])
+
+
+def read_csv(path):
+    return np.loadtxt(path, delimiter=',', comments='#', ndmin=2)
+
+
+def read_table(path, where='/measurement'):
+    with tb.open_file(path) as h5file:
+        return h5file.get_node(where).read()
+
+
+def write_all_paths(writer, rows):
+    # Write *rows* through every path of *writer*, mixing buffered and direct writes
+    writer.write_row(*rows[0])
+    writer.write_row(**dict(zip(COLUMNS, rows[1])))
+    writer.write_rows(rows[2:4])
+    writer.write_row(*rows[4])
+    writer.write_rows([dict(zip(COLUMNS, row)) for row in rows[5:7]])
+    writer.write_columns(**dict(zip(COLUMNS, np.transpose(rows[7:9]))))
+    for row in rows[9:]:
+        writer.write_row(*row)
+
+
+@pytest.fixture
+def rows():
+    return [(float(i), -float(i), 1e-9 * i) for i in range(20)]
+
+
+@pytest.mark.parametrize('batch_size', [1, 3, 100])
+def test_csv_row_order(tmp_path, rows, batch_size):
+    outfile = str(tmp_path / 'iv.csv')
+
+    with DataWriter(outfile, columns=COLUMNS, batch_size=batch_size) as writer:
+        write_all_paths(writer, rows)
+
+    np.testing.assert_array_equal(read_csv(outfile), rows)
+
+
+@pytest.mark.parametrize('batch_size', [1, 3, 100])
+def test_tables_row_order(tmp_path, rows, batch_size):
+    outfile = str(tmp_path / 'iv.h5')
+
+    with DataWriter(outfile, columns=DTYPE, outtype=DataWriter.TABLES, batch_size=batch_size) as writer:
+        write_all_paths(writer, rows)
+
+    np.testing.assert_array_equal(read_table(outfile), np.array(rows, dtype=DTYPE))
+
+
+@pytest.mark.parametrize('outtype', [DataWriter.CSV, DataWriter.TABLES])
+def test_single_column(tmp_path, outtype):
+    columns = ['current'] if outtype == DataWriter.CSV else np.dtype([('current', float)])
+    outfile = str(tmp_path / 'single')
+
+    with DataWriter(outfile, columns=columns, outtype=outtype, batch_size=2) as writer:
+        writer.write_row(1.)
+        writer.write_row(current=2.)
+        writer.write_rows([(3.,), {'current': 4.}])
+        writer.write_columns(current=[5., 6.])
+        writer.write_row(current=7.)
+
+    if outtype == DataWriter.CSV:
+        currents = read_csv(writer.out_file)[:, 0]
+    else:
+        currents = read_table(writer.out_file)['current']
+
+    np.testing.assert_array_equal(currents, np.arange(1., 8.))
+
+
+def test_write_row_keyword_errors(tmp_path):
+    with DataWriter(str(tmp_path / 'iv.csv'), columns=COLUMNS) as writer:
+        with pytest.raises(KeyError):
+            writer.write_row(timestamp=0., bias=0., voltage=0.)
+        with pytest.raises(ValueError):
+            writer.write_row(0., bias=0.)
+        with pytest.raises(ValueError):
+            writer.write_columns(timestamp=[0., 1.], bias=[0.], current=[0., 1.])
+
+
+@pytest.mark.parametrize('n_rows, flushed', [(1, False), (2, True), (6, True)])
+def test_write_rows_flush_every(tmp_path, rows, n_rows, flushed):
+    outfile = str(tmp_path / 'iv.csv')
+
+    with DataWriter(outfile, columns=COLUMNS, flush_every=5) as writer:
+        for row in rows[:3]:
+            writer.write_row(*row)
+        # The rows cross a multiple of *flush_every* if at least 2 rows are written
+        writer.write_rows(rows[3:3 + n_rows])
+
+        if flushed:
+            np.testing.assert_array_equal(read_csv(outfile), rows[:3 + n_rows])
+        else:
+            with open(outfile) as f:
+                assert f.read() == ''
+
+    np.testing.assert_array_equal(read_csv(outfile), rows[:3 + n_rows])
+
+
+def test_write_row_flush_every(tmp_path, rows):
+    outfile = str(tmp_path / 'iv.h5')
+
+    with DataWriter(outfile, columns=DTYPE, outtype=DataWriter.TABLES, batch_size=100, flush_every=4) as writer:
+        for row in rows[:6]:
+            writer.write_row(*row)
+        # Rows up to the last multiple of *flush_every* are in the table, the remaining ones are buffered
+        assert writer._writer[DataWriter.TABLES].nrows == 4
+
+
+def test_h5_session_layout(tmp_path, rows):
+    outfile = str(tmp_path / 'session.h5')
+
+    with H5Session(outfile) as session:
+        for i in range(3):
+            with session.writer(group_name=f'sweep_{i}', columns=DTYPE, identifier='iv', comments=f'sweep {i}',
+                                batch_size=3) as writer:
+                writer.write_rows(rows[i:i + 5])
+        # Leaving the context of a writer does not close the file of the session
+        assert session.file.isopen
+        with session.writer(group_name=None, columns=DTYPE) as writer:
+            writer.write_row(*rows[0])
+
+    with tb.open_file(outfile) as h5file:
+        groups = sorted(group._v_name for group in h5file.list_nodes('/', classname='Group'))
+        assert groups == ['sweep_0', 'sweep_1', 'sweep_2']
+        for i in range(3):
+            table = h5file.get_node(f'/sweep_{i}/iv')
+            assert table.title == f'Comments: sweep {i}'
+            np.testing.assert_array_equal(table.read(), np.array(rows[i:i + 5], dtype=DTYPE))
+        np.testing.assert_array_equal(h5file.root.measurement.read(), np.array(rows[:1], dtype=DTYPE))
+
+
+def test_h5_session_writer_error_keeps_file_open(tmp_path, rows):
+    with H5Session(str(tmp_path / 'session.h5')) as session:
+        with pytest.raises(ValueError):
+            with session.writer(group_name='sweep', columns=DTYPE) as writer:
+                writer.write_row(*rows[0])
+                raise ValueError
+        assert session.file.isopen
+
+
+@pytest.mark.parametrize('outtype', [DataWriter.CSV, DataWriter.TABLES])
+def test_exclusive_creation(tmp_path, outtype):
+    columns = COLUMNS if outtype == DataWriter.CSV else DTYPE
+    outfile = str(tmp_path / 'iv')
+
+    writer = DataWriter(outfile, columns=columns, outtype=outtype)
+
+    # The file came into existence between initialization and opening
+    with open(writer.out_file, 'w') as f:
+        f.write('precious')
+
+    with pytest.raises(FileExistsError):
+        with writer:
+            pass
+
+    with open(writer.out_file) as f:
+        assert f.read() == 'precious'
+
+    # Existing files are only overwritten if allowed
+    with pytest.raises(IOError):
+        DataWriter(outfile, columns=columns, outtype=outtype)
+
+    with DataWriter(outfile, columns=columns, outtype=outtype, overwrite=True) as writer:
+        writer.write_row(0., 1., 2.)
+
+
+def test_h5_session_exclusive_creation(tmp_path):
+    outfile = str(tmp_path / 'session.h5')
+    session = H5Session(outfile)
+
+    with open(outfile, 'w') as f:
+        f.write('precious')
+
+    with pytest.raises(FileExistsError):
+        with session:
+            pass
+
+    with pytest.raises(IOError):
+        H5Session(outfile)
+
+
+def test_close_after_failing_write(tmp_path):
+    outfile = str(tmp_path / 'iv.csv')
+
+    # A value containing the delimiter cannot be written without quoting
+    with pytest.raises(csv.Error):
+        with DataWriter(outfile, columns=['bias', 'note'], csv_quoting=csv.QUOTE_NONE) as writer:
+            writer.write_row(1., 'ok')
+            writer.write_row(2., 'x,y')
+
+    # The header and the rows preceding the failing row are still written
+    assert writer.file.closed
+    with open(outfile) as f:
+        lines = f.read().splitlines()
+    assert lines[0] == '# Identifier:'
+    assert lines[-1] == '1.0,ok'
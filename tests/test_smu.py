@@ -0,0 +1,170 @@
+import numpy as np
+import pytest
+
+import silab_collections.meas.smu as smu_utils
+
+
+class RecordingIntf:
+    """Transfer layer recording all commands written to and queried from it"""
+
+    def __init__(self):
+        self.cmds = []
+        self.responses = {':FETC?': self._fetch_sweep}
+
+    def write(self, cmd):
+        self.cmds.append(cmd)
+
+    def query(self, cmd):
+        self.cmds.append(cmd)
+        response = self.responses.get(cmd, '1')
+        return response() if callable(response) else response
+
+    def _fetch_sweep(self):
+        # Voltages of the last programmed linear sweep
+        settings = dict(cmd.split(' ', 1) for cmd in self.cmds if ' ' in cmd)
+        volts = np.linspace(float(settings[':SOUR:VOLT:STAR']), float(settings[':SOUR:VOLT:STOP']), int(settings[':SOUR:SWE:POIN']))
+        return ','.join(f'{v:.6E}' for v in volts)
+
+
+class Keithley2410:
+    """Minimal stand-in of an unformatted basil Keithley 2410 hardware layer which is already on"""
+
+    def __init__(self, voltage):
+        self._intf = RecordingIntf()
+        self._smu_type = 'KEITHLEY_2410'
+        self._uses_formatting = False
+        self._last_voltage = voltage
+
+    def get_on(self):
+        return '1'
+
+    def on(self):
+        pass
+
+
+@pytest.fixture
+def smu(monkeypatch):
+    monkeypatch.setattr(smu_utils, 'sleep', lambda delay: None)
+    monkeypatch.setattr(smu_utils, 'get_voltage_reading', lambda smu: 0.0)
+    return Keithley2410(voltage=-500)
+
+
+def test_ramp_voltage_sweep_command_order(smu):
+    smu_utils.ramp_voltage(smu, target_voltage=0, delay=0.1)
+    cmds = smu._intf.cmds
+
+    # The sweep must be set up in sweep mode, otherwise the output follows the fixed source level immediately
+    assert cmds[0] == ':SOUR:VOLT:MODE SWE'
+
+    # The fixed source level is only set to the target once the sweep reached it, before returning to fixed mode
+    levels = [i for i, cmd in enumerate(cmds) if cmd.startswith(':SOUR:VOLT:LEV')]
+    assert len(levels) == 1
+    assert cmds[levels[0]] == ':SOUR:VOLT:LEV 0.000000E+00'
+    assert cmds.index(':INIT') < cmds.index('*OPC?') < cmds.index(':FETC?') < levels[0] < cmds.index(':SOUR:VOLT:MODE FIX')
+    assert smu._last_voltage == 0
+
+
+def test_ramp_voltage_sweep_interrupted(smu, monkeypatch):
+    def interrupt(cmd):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(smu._intf, 'query', interrupt)
+
+    with pytest.raises(KeyboardInterrupt):
+        smu_utils.ramp_voltage(smu, target_voltage=0, delay=0.1)
+
+    # The fixed source level is left untouched and the applied voltage is not tracked anymore
+    assert not any(cmd.startswith(':SOUR:VOLT:LEV') for cmd in smu._intf.cmds)
+    assert smu._intf.cmds[-4:-1] == [':SOUR:VOLT:MODE FIX', ':TRIG:COUN 1', ':SOUR:DEL:AUTO ON']
+    assert '_last_voltage' not in vars(smu)
+
+
+def test_ramp_voltage_sweep_rejected(smu):
+    # The smu did not run the sweep, e.g. because it rejected the sweep settings, and still holds the start voltage
+    smu._intf.responses[':FETC?'] = '-5.000000E+02'
+
+    with pytest.raises(RuntimeError):
+        smu_utils.ramp_voltage(smu, target_voltage=0, delay=0.1)
+
+    # The output must not be set to the target without ramping
+    assert not any(cmd.startswith(':SOUR:VOLT:LEV') for cmd in smu._intf.cmds)
+    assert '_last_voltage' not in vars(smu)
+
+
+def test_ramp_voltage_too_many_sweep_points(smu):
+    # Too many points for a sweep of the smu, so the voltage is stepped in software instead
+    smu._scpi_commands = {'set_voltage': ':SOUR:VOLT'}
+    smu._last_voltage = -3000
+
+    smu_utils.ramp_voltage(smu, target_voltage=0, delay=0.1)
+
+    assert ':SOUR:VOLT:MODE SWE' not in smu._intf.cmds
+    assert smu._intf.cmds[0] == ':SOUR:VOLT -3.000000E+03'
+    assert smu._intf.cmds[-1] == ':SOUR:VOLT 0.000000E+00'
+    assert smu._last_voltage == 0
+
+
+def test_ramp_voltage_verifies_stale_voltage(smu, monkeypatch):
+    # The voltage was changed without set_voltage since the last ramp, e.g. manually in between scans
+    smu._last_voltage = 0
+    monkeypatch.setattr(smu_utils, 'get_voltage_reading', lambda smu: smu._last_voltage if smu._intf.cmds else -100.0)
+
+    smu_utils.ramp_voltage(smu, target_voltage=0, delay=0.1)
+
+    assert ':SOUR:VOLT:STAR -1.000000E+02' in smu._intf.cmds
+    assert smu._last_voltage == 0
+
+
+def test_set_voltage_uses_hardware_layer_method():
+
+    class Keithley2410Custom(Keithley2410):
+
+        def set_voltage(self, voltage):
+            self._intf.write(f'custom {voltage}')
+
+    # The command table entry must not bypass a set_voltage implemented by the hardware layer
+    custom_smu = Keithley2410Custom(voltage=0)
+    custom_smu._scpi_commands = {'set_voltage': ':SOUR:VOLT'}
+    smu_utils.set_voltage(custom_smu, -10)
+    assert custom_smu._intf.cmds == ['custom -10']
+
+    plain_smu = Keithley2410(voltage=0)
+    plain_smu._scpi_commands = {'set_voltage': ':SOUR:VOLT'}
+    smu_utils.set_voltage(plain_smu, -10)
+    assert plain_smu._intf.cmds == [':SOUR:VOLT -1.000000E+01']
+
+
+def test_run_sweep_readings(smu):
+    # Current and time of each voltage step of the last source list
+    def fetch_list():
+        n_volts = int([cmd for cmd in smu._intf.cmds if cmd.startswith(':TRIG:COUN')][-1].split()[1])
+        return ','.join(f'{1e-9 * i:.6E},{float(i):.6E}' for i in range(n_volts))
+
+    smu._intf.responses[':FETC?'] = fetch_list
+    currents, times = smu_utils.run_sweep(smu, np.linspace(0, -149, 150), settle_delay=0.1)
+
+    assert currents.shape == times.shape == (150,)
+    # Each chunk of the source list is fetched only once the sweep completed
+    cmds = smu._intf.cmds
+    assert [cmds[i - 1] for i, cmd in enumerate(cmds) if cmd == ':FETC?'] == ['*OPC?'] * 2
+    assert smu._last_voltage == -149
+
+
+def test_run_sweep_missing_readings(smu):
+    smu._intf.responses[':FETC?'] = '1.000000E-09,0.000000E+00'
+
+    with pytest.raises(RuntimeError):
+        smu_utils.run_sweep(smu, np.linspace(0, -9, 10), settle_delay=0.1)
+
+    assert '_last_voltage' not in vars(smu)
+
+
+def test_read_current_burst(smu):
+    smu._intf.responses[':FETC?'] = '1.000000E-09,2.000000E-09,3.000000E-09'
+    out = np.zeros(3)
+
+    assert smu_utils.read_current_burst(smu, n_meas=3, delay=0.1, out=out) is out
+    np.testing.assert_array_equal(out, [1e-9, 2e-9, 3e-9])
+    # The readings are fetched once complete instead of blocking on :READ? for the whole burst
+    assert smu._intf.cmds[0].endswith(':TRIG:COUN 3;:INIT')
+    assert smu._intf.cmds[1:3] == ['*OPC?', ':FETC?']